@@ -0,0 +1,125 @@
+# DART OpenAPI 공용 모듈 (equity_linked.py, rights_issue.py 가 같이 씀)
+# 세션/재시도 설정, 목록·상세 JSON 조회, 공시 원문 ZIP 다운로드와 텍스트 추출을 한 곳에서 관리
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import zipfile
+import tempfile
+import re
+import lxml.html
+from concurrent.futures import ThreadPoolExecutor
+
+# DART API 동시 호출 개수 (네트워크 대기 시간을 겹쳐서 줄이되, DART 호출 한도를 넘지 않도록 8개로 제한)
+MAX_WORKERS = 8
+
+# DART 호출용 공용 세션 (매번 새로 TCP/TLS 연결을 맺지 않고 연결을 재사용, 일시적 오류는 자동 재시도)
+session = requests.Session()
+session.mount('https://', HTTPAdapter(
+    pool_connections=1, pool_maxsize=MAX_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
+# 응답 없는 연결에 워크플로가 무한정 걸려 있지 않도록 (연결, 읽기) 타임아웃(초)
+REQUEST_TIMEOUT = (10, 60)
+
+# --- [JSON 파싱] ---
+# 정상 응답(status 000 + list)이면 응답 dict 전체를, 아니면 빈 dict를 돌려줌
+def fetch_dart_data(url, params):
+    try:
+        res = session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+        if res.status_code == 200:
+            data = res.json()
+            if data.get('status') == '000' and 'list' in data:
+                return data
+            # 013(조회 데이터 없음)은 정상, 그 외(020 요청 한도 초과 등)는 동시 호출 중 조용히 빠지지 않도록 로그로 남김
+            if data.get('status') != '013':
+                print(f"DART API 응답 오류 [{data.get('status')}]: {data.get('message', '')}")
+        else:
+            # 재시도 후에도 200이 아니면 (5xx, 403 등) 빈 결과가 조용히 섞이지 않도록 로그로 남김
+            print(f"DART API HTTP 오류 [{res.status_code}]: {url}")
+    except Exception as e:
+        print(f"JSON API 에러: {e}")
+    return {}
+
+# --- [공시 목록 전체 페이지 조회] ---
+# 💡 list.json은 한 번에 최대 100건(page_count)까지만 주므로, 1페이지에서 total_page를 확인한 뒤
+#    나머지 페이지는 동시에 요청해서 페이지 순서대로 이어붙임 (기존엔 1페이지 이후 공시가 누락됐음)
+def fetch_dart_list(url, params):
+    first = fetch_dart_data(url, {**params, 'page_no': '1'})
+    if not first:
+        return pd.DataFrame()
+
+    items = list(first['list'])
+    total_page = int(first.get('total_page') or 1)
+    if total_page > 1:
+        page_nos = range(2, total_page + 1)
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            pages = list(executor.map(lambda page_no: fetch_dart_data(url, {**params, 'page_no': str(page_no)}), page_nos))
+        # 💡 [추가] total_page 안쪽인데 비어서 돌아온 페이지가 있으면 목록이 불완전하다는 걸 크게 알림
+        #    (이번 실행에서 빠진 공시는 시트에서 지워지지 않고, 다음 실행에서 다시 조회됨)
+        failed_pages = [page_no for page_no, page in zip(page_nos, pages) if not page.get('list')]
+        if failed_pages:
+            print(f"⚠️ 공시 목록 {total_page}페이지 중 {failed_pages}페이지를 받지 못했습니다. 이번 실행은 일부 공시가 빠진 목록으로 진행합니다.")
+        for page in pages:
+            items.extend(page.get('list', []))
+    # 💡 [수정] 1페이지 조회 뒤 새 공시가 올라오면 1페이지 마지막 공시가 2페이지 첫 줄로 밀려 두 번 들어옴
+    #    → 접수번호 기준으로 중복 제거 (안 하면 merge에서 행이 두 배가 되어 시트에 같은 공시가 두 줄 추가됨)
+    df = pd.DataFrame(items)
+    return df.drop_duplicates('rcept_no', ignore_index=True) if not df.empty else df
+
+# --- [원문 텍스트 추출] ---
+# BeautifulSoup 대신 lxml(C 파서)로 한 번만 파싱하고 텍스트 노드만 공백으로 이어붙임
+# (바이트를 그대로 넘겨서 별도 디코딩 없음, soup.get_text(separator=' ', strip=True)와 맞추기 위한 처리)
+#  - lxml HTML 파서는 <![CDATA[...]]> 안의 글자를 버리므로, 파싱 전에 CDATA를 이스케이프된 일반 텍스트 노드로 풀어줌
+#  - <script>/<style>/<template> 안의 글자는 BeautifulSoup처럼 빼고 모음 (필드 정규식이 코드/스타일에 걸리지 않도록)
+#  - 남는 차이: 문서 맨 앞 BOM(\ufeff)은 lxml이 인코딩 표시로 소비하므로 결과 텍스트에 남지 않음 (BeautifulSoup은 남겼음)
+# 💡 [변경] utf-8로 고정하지 않고 XML 선언(<?xml ... encoding="..."?>)에 적힌 인코딩으로 한 번에 파싱
+#    (선언이 없거나 모르는 이름이면 utf-8)
+XML_ENCODING_RE = re.compile(rb'^(?:\xef\xbb\xbf)?\s*<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+
+def detect_encoding(xml_bytes):
+    m = XML_ENCODING_RE.match(xml_bytes, 0, 256)
+    return m.group(1).decode('ascii') if m else 'utf-8'
+
+TEXT_XPATH = '//text()[not(ancestor::script) and not(ancestor::style) and not(ancestor::template)]'
+
+CDATA_RE = re.compile(rb'<!\[CDATA\[(.*?)\]\]>', re.S)
+
+def unwrap_cdata(match):
+    # CDATA 안의 <, >, & 가 태그로 해석되지 않도록 이스케이프하고, 앞뒤 글자와 붙지 않게 별도 노드로 감쌈
+    text = match.group(1).replace(b'&', b'&amp;').replace(b'<', b'&lt;').replace(b'>', b'&gt;')
+    return b'<span>' + text + b'</span>'
+
+def extract_text(xml_bytes):
+    # 파서는 문서마다 새로 만듦 (lxml 파서는 스레드끼리 공유할 수 없고, 스레드 풀이 단계마다 새로 떠서 캐시해도 재사용이 거의 없음)
+    try:
+        parser = lxml.html.HTMLParser(encoding=detect_encoding(xml_bytes))
+    except LookupError:  # lxml이 모르는 인코딩 이름이면 utf-8로 처리
+        parser = lxml.html.HTMLParser(encoding='utf-8')
+    if b'<![CDATA[' in xml_bytes:
+        xml_bytes = CDATA_RE.sub(unwrap_cdata, xml_bytes)
+    root = lxml.html.document_fromstring(xml_bytes, parser=parser)
+    return ' '.join(t.strip() for t in root.xpath(TEXT_XPATH) if t.strip())
+
+# --- [공시 원문 ZIP 다운로드] ---
+# 💡 응답 전체를 res.content + BytesIO로 메모리에 두 번 올리지 않고 임시 파일로 흘려받은 뒤,
+#    ZIP 안의 XML 파일 하나만 꺼내서 바이트로 돌려줌
+#    (SpooledTemporaryFile은 Python 3.10에서 seekable()이 없어 ZipFile.open이 실패하므로 TemporaryFile 사용)
+def fetch_document_xml(api_key, rcept_no):
+    url = "https://opendart.fss.or.kr/api/document.xml"
+    params = {'crtfc_key': api_key, 'rcept_no': rcept_no}
+
+    with session.get(url, params=params, stream=True, timeout=REQUEST_TIMEOUT) as res:
+        if res.status_code != 200:
+            return None
+        with tempfile.TemporaryFile() as buf:
+            for chunk in res.iter_content(chunk_size=64 * 1024):
+                buf.write(chunk)
+            buf.seek(0)
+            with zipfile.ZipFile(buf) as z:
+                # 첫 번째 .xml 파일에서 바로 멈춤 (전체 목록을 걸러서 만들지 않음)
+                xml_filename = next((name for name in z.namelist() if name.endswith('.xml')), None)
+                if xml_filename is None:
+                    return None
+                with z.open(xml_filename) as f:
+                    return f.read()
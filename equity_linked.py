@@ -2,13 +2,11 @@ import os
 import json
 import gspread
 import pandas as pd
-import requests
-import zipfile
-import io
 import re
-import time  # 업데이트 시 구글 API 과부하 방지용으로 추가
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+# DART 호출·원문 다운로드/파싱 공용 함수 (두 봇이 같이 씀)
+from dart_client import MAX_WORKERS, fetch_dart_data, fetch_dart_list, fetch_document_xml, extract_text
 
 # 1. GitHub Secrets 설정값
 dart_key = os.environ['DART_API_KEY']
@@ -20,70 +18,81 @@ creds = json.loads(service_account_str)
 gc = gspread.service_account_from_dict(creds)
 sh = gc.open_by_key(sheet_id)
 
-# --- [JSON 파싱] ---
-def fetch_dart_json(url, params):
-    try:
-        res = requests.get(url, params=params)
-        if res.status_code == 200:
-            data = res.json()
-            if data.get('status') == '000' and 'list' in data:
-                return pd.DataFrame(data['list'])
-    except Exception as e:
-        print(f"JSON API 에러: {e}")
-    return pd.DataFrame()
+# 3. 채권 종류별 설정값 (API 필드명이 다르므로 매핑)
+BOND_CONFIGS = [
+    {'type': 'CB', 'keyword': '전환사채권발행결정', 'endpoint': 'cvbdIsDecsn', 'fields': {'price': 'cv_prc', 'shares': 'cvisstk_cnt', 'ratio': 'cvisstk_tisstk_vs', 'start': 'cvrqpd_bgd', 'end': 'cvrqpd_edd', 'refix': 'act_mktprcfl_cvprc_lwtrsprc'}},
+    {'type': 'BW', 'keyword': '신주인수권부사채권발행결정', 'endpoint': 'bdwtIsDecsn', 'fields': {'price': 'ex_prc', 'shares': 'nstk_isstk_cnt', 'ratio': 'nstk_isstk_tisstk_vs', 'start': 'expd_bgd', 'end': 'expd_edd', 'refix': 'act_mktprcfl_cvprc_lwtrsprc'}},
+    {'type': 'EB', 'keyword': '교환사채권발행결정', 'endpoint': 'exbdIsDecsn', 'fields': {'price': 'ex_prc', 'shares': 'extg_stkcnt', 'ratio': 'extg_tisstk_vs', 'start': 'exrqpd_bgd', 'end': 'exrqpd_edd', 'refix': ''}}
+]
+
+# 자금용도 항목 (DART 필드명, 시트에 표시할 이름) - 공시마다 6개 필드를 같은 순서로 훑음
+PURPOSE_FIELDS = (
+    ('fdpp_fclt', '시설'), ('fdpp_bsninh', '영업양수'), ('fdpp_op', '운영'),
+    ('fdpp_dtrp', '채무상환'), ('fdpp_ocsa', '타법인증권'), ('fdpp_etc', '기타'),
+)
+
+# 상장시장 코드(corp_cls) → 시트에 표시할 이름
+MARKET_MAP = {'Y': '유가', 'K': '코스닥', 'N': '코넥스', 'E': '기타'}
+
+# 봇이 쓰는 시트 범위와 한 줄의 칸 수 (A~Y열 25칸, 마지막 칸이 접수번호)
+SHEET_RANGE = 'A1:Y'
+ROW_WIDTH = 25
+
+# 상세/원문을 다시 받아 정정 여부를 확인할 기간(일) - 이보다 오래되고 이미 시트에 있는 공시는 재조회하지 않음
+# (두 봇이 5분마다 같은 DART 키의 일일 호출 한도를 나눠 쓰므로, 목록 전체를 매번 재검사하면 한도 초과(020) 위험)
+RECHECK_DAYS = 2
+
+# --- [정규식 미리 컴파일] ---
+# 공시마다 같은 패턴을 다시 해석하지 않도록 모듈 로딩 시 한 번만 컴파일
+# report_nm에서 채권 종류 키워드를 한 번에 찾아내는 분류용 정규식 (종류별로 3번 훑던 것을 1번으로)
+BOND_KEYWORD_RE = re.compile('(' + '|'.join(re.escape(c['keyword']) for c in BOND_CONFIGS) + ')')
+WHITESPACE_RE = re.compile(r'\s+')
+PUT_OPTION_RE = re.compile(r'(조기상환\s*청구권.{0,500})')
+CALL_OPTION_RE = re.compile(r'(매도\s*청구권.{0,500})')
+CALL_RATIO_RE = re.compile(r'([0-9]{1,3}(?:\.[0-9]+)?)\s*%')
+YTC_RE = re.compile(r'매도청구권.*?수익률.{0,50}?([0-9]{1,2}(?:\.[0-9]+)?)\s*%')
+INVESTOR_RE = re.compile(r'배정\s*대상자.{0,100}?(주식회사\s*\S+|\S+\s*투자조합|\S+\s*펀드|[가-힣]{2,4})')
 
 # --- [채권 전용 XML 원문 족집게 파싱 (콜/풋옵션 내용 추출 500자로 대폭 확장)] ---
-# (작성해주신 원본 함수 그대로 유지)
+# 추출 규칙은 원본과 같고, 다운로드(임시 파일 스트리밍)·파싱(lxml)·정규식(미리 컴파일)만 공용 함수로 교체
 def extract_bond_xml_details(api_key, rcept_no):
-    url = "https://opendart.fss.or.kr/api/document.xml"
-    params = {'crtfc_key': api_key, 'rcept_no': rcept_no}
-    
     extracted = {
         'put_option': '없음', 'call_option': '없음', 
         'call_ratio': '-', 'ytc': '-', 'investor': '원문참조'
     }
     
     try:
-        res = requests.get(url, params=params, stream=True)
-        if res.status_code == 200:
-            with zipfile.ZipFile(io.BytesIO(res.content)) as z:
-                xml_filename = [name for name in z.namelist() if name.endswith('.xml')][0]
-                with z.open(xml_filename) as f:
-                    xml_content = f.read().decode('utf-8')
-                    soup = BeautifulSoup(xml_content, 'html.parser')
-                    
-                    for tag in soup.find_all(['td', 'th', 'p', 'div']):
-                        tag.append(' ')
-                        
-                    raw_text = soup.get_text(separator=' ', strip=True)
-                    clean_text = re.sub(r'\s+', ' ', raw_text)
+        xml_bytes = fetch_document_xml(api_key, rcept_no)
+        if xml_bytes:
+            raw_text = extract_text(xml_bytes)
+            clean_text = WHITESPACE_RE.sub(' ', raw_text)
+            
+            # 💡 1. Put Option (조기상환청구권) : 500자로 넉넉하게 추출
+            put_match = PUT_OPTION_RE.search(clean_text)
+            if put_match:
+                extracted['put_option'] = put_match.group(1).strip() + "..."
+                
+            # 💡 2. Call Option (매도청구권) : 500자로 넉넉하게 추출
+            call_match = CALL_OPTION_RE.search(clean_text)
+            if call_match:
+                extracted['call_option'] = call_match.group(1).strip() + "..."
+                
+                # Call 비율 추출
+                ratio_match = CALL_RATIO_RE.search(call_match.group(0))
+                if ratio_match:
+                    extracted['call_ratio'] = ratio_match.group(1) + '%'
                     
-                    # 💡 1. Put Option (조기상환청구권) : 500자로 넉넉하게 추출
-                    put_match = re.search(r'(조기상환\s*청구권.{0,500})', clean_text)
-                    if put_match:
-                        extracted['put_option'] = put_match.group(1).strip() + "..."
-                        
-                    # 💡 2. Call Option (매도청구권) : 500자로 넉넉하게 추출
-                    call_match = re.search(r'(매도\s*청구권.{0,500})', clean_text)
-                    if call_match:
-                        extracted['call_option'] = call_match.group(1).strip() + "..."
-                        
-                        # Call 비율 추출
-                        ratio_match = re.search(r'([0-9]{1,3}(?:\.[0-9]+)?)\s*%', call_match.group(0))
-                        if ratio_match:
-                            extracted['call_ratio'] = ratio_match.group(1) + '%'
-                            
-                    # 3. YTC (매도청구권 수익률)
-                    ytc_match = re.search(r'매도청구권.*?수익률.{0,50}?([0-9]{1,2}(?:\.[0-9]+)?)\s*%', clean_text)
-                    if ytc_match:
-                        extracted['ytc'] = ytc_match.group(1) + '%'
-                        
-                    # 4. 투자자 (대상자) 추출 시도
-                    inv_match = re.search(r'배정\s*대상자.{0,100}?(주식회사\s*\S+|\S+\s*투자조합|\S+\s*펀드|[가-힣]{2,4})', clean_text)
-                    if inv_match:
-                        extracted['investor'] = inv_match.group(1).strip()
-                    elif "제3자배정" in clean_text:
-                        extracted['investor'] = "제3자배정 (원문참조)"
+            # 3. YTC (매도청구권 수익률)
+            ytc_match = YTC_RE.search(clean_text)
+            if ytc_match:
+                extracted['ytc'] = ytc_match.group(1) + '%'
+                
+            # 4. 투자자 (대상자) 추출 시도
+            inv_match = INVESTOR_RE.search(clean_text)
+            if inv_match:
+                extracted['investor'] = inv_match.group(1).strip()
+            elif "제3자배정" in clean_text:
+                extracted['investor'] = "제3자배정 (원문참조)"
 
     except Exception as e:
         print(f"채권 XML 에러 ({rcept_no}): {e}")
@@ -93,32 +102,24 @@ def extract_bond_xml_details(api_key, rcept_no):
 # 안전한 숫자 변환 함수
 def to_int(val):
     try:
-        if pd.isna(val) or str(val).strip() == '': return 0
-        return int(float(str(val).replace(',', '').strip()))
+        if pd.isna(val): return 0
+        s = str(val).replace(',', '').strip()
+        if s == '': return 0
+        # 대부분 정수 문자열이라 float를 거치지 않고 바로 변환
+        if s.isdigit(): return int(s)
+        return int(float(s))
     except:
         return 0
 
 
 # 💡 [추가] 신규 추가 & 업데이트 양쪽에서 똑같이 쓸 수 있도록 기존 포매팅 코드를 함수로 묶음
-def make_row_data(row, xml_data, config, cls_map):
+def make_row_data(row, xml_data, config):
     f_map = config['fields']
     rcept_no = str(row.get('rcept_no', ''))
     corp_name = row.get('corp_name', '')
     
-    fclt = to_int(row.get('fdpp_fclt'))
-    bsninh = to_int(row.get('fdpp_bsninh'))
-    op = to_int(row.get('fdpp_op'))
-    dtrp = to_int(row.get('fdpp_dtrp'))
-    ocsa = to_int(row.get('fdpp_ocsa'))
-    etc = to_int(row.get('fdpp_etc'))
-    
-    purposes = []
-    if fclt > 0: purposes.append("시설")
-    if bsninh > 0: purposes.append("영업양수")
-    if op > 0: purposes.append("운영")
-    if dtrp > 0: purposes.append("채무상환")
-    if ocsa > 0: purposes.append("타법인증권")
-    if etc > 0: purposes.append("기타")
+    # 자금용도: 금액이 0보다 큰 항목 이름만 순서대로
+    purposes = [label for key, label in PURPOSE_FIELDS if to_int(row.get(key)) > 0]
     purpose_str = ", ".join(purposes) if purposes else "-"
 
     face_value = to_int(row.get('bd_fta'))
@@ -142,7 +143,7 @@ def make_row_data(row, xml_data, config, cls_map):
     return [
         config['type'],                             # 1. 구분 (CB, BW, EB)
         corp_name,                                  # 2. 회사명
-        cls_map.get(row.get('corp_cls', ''), '기타'),# 3. 상장시장
+        MARKET_MAP.get(row.get('corp_cls', ''), '기타'),# 3. 상장시장
         str(row.get('bddd', '-')),                  # 4. 최초 이사회결의일
         face_value_str,                             # 5. 권면총액(원)
         str(row.get('bd_intr_ex', '-')),            # 6. Coupon (표면이자율)
@@ -169,8 +170,10 @@ def make_row_data(row, xml_data, config, cls_map):
 
 
 def get_and_update_bonds():
-    end_date = datetime.now().strftime('%Y%m%d')
-    start_date = (datetime.now() - timedelta(days=12)).strftime('%Y%m%d')
+    # 실행 시각은 한 번만 읽어서 시작/종료일을 같은 기준으로 계산 (자정 직전 실행 시 날짜가 어긋나지 않음)
+    now = datetime.now()
+    end_date = now.strftime('%Y%m%d')
+    start_date = (now - timedelta(days=12)).strftime('%Y%m%d')
 
     print("최근 12일 주식연계채권(CB, BW, EB) 공시 탐색 중...")
     
@@ -180,75 +183,92 @@ def get_and_update_bonds():
         'crtfc_key': dart_key, 'bgn_de': start_date, 'end_de': end_date, 
         'pblntf_ty': 'B', 'pblntf_detail_ty': 'B001', 'page_count': '100'
     }
-    all_filings = fetch_dart_json(list_url, list_params)
+    all_filings = fetch_dart_list(list_url, list_params)
 
     if all_filings.empty:
         print("최근 지정 기간 내 주요사항보고서가 없습니다.")
         return
 
-    # 채권 종류별 설정값 (API 필드명이 다르므로 매핑)
-    bond_configs = [
-        {'type': 'CB', 'keyword': '전환사채권발행결정', 'endpoint': 'cvbdIsDecsn', 'fields': {'price': 'cv_prc', 'shares': 'cvisstk_cnt', 'ratio': 'cvisstk_tisstk_vs', 'start': 'cvrqpd_bgd', 'end': 'cvrqpd_edd', 'refix': 'act_mktprcfl_cvprc_lwtrsprc'}},
-        {'type': 'BW', 'keyword': '신주인수권부사채권발행결정', 'endpoint': 'bdwtIsDecsn', 'fields': {'price': 'ex_prc', 'shares': 'nstk_isstk_cnt', 'ratio': 'nstk_isstk_tisstk_vs', 'start': 'expd_bgd', 'end': 'expd_edd', 'refix': 'act_mktprcfl_cvprc_lwtrsprc'}},
-        {'type': 'EB', 'keyword': '교환사채권발행결정', 'endpoint': 'exbdIsDecsn', 'fields': {'price': 'ex_prc', 'shares': 'extg_stkcnt', 'ratio': 'extg_tisstk_vs', 'start': 'exrqpd_bgd', 'end': 'exrqpd_edd', 'refix': ''}}
-    ]
+    # 💡 [변경] 공시명을 한 번만 훑어서 채권 종류 키워드를 뽑아둠 (해당 없으면 NaN)
+    bond_keywords = all_filings['report_nm'].str.extract(BOND_KEYWORD_RE, expand=False)
 
     worksheet = sh.worksheet('주식연계채권')
-    cls_map = {'Y': '유가', 'K': '코스닥', 'N': '코넥스', 'E': '기타'}
 
     # 💡 [변경] 시트의 전체 데이터를 읽어와서 행 번호(Row Index)와 기존 값을 모두 매핑해둡니다. (Diff/Update 용도)
-    all_sheet_data = worksheet.get_all_values()
-    rcept_row_map = {row[24]: i + 1 for i, row in enumerate(all_sheet_data) if len(row) > 24}
-    existing_rcept_nos = list(rcept_row_map.keys())
+    # 봇이 쓰는 A~Y열(25칸)만 범위를 지정해서 읽어옴 (옆에 메모용 열이 늘어나도 전송량/Diff 오탐 없음)
+    # Diff는 시트에 보이는 문자열 그대로 비교해야 하므로 UNFORMATTED_VALUE가 아닌 기본(FORMATTED) 렌더링 유지
+    all_sheet_data = worksheet.get_values(SHEET_RANGE)
+    rcept_row_map = {row[ROW_WIDTH - 1]: i + 1 for i, row in enumerate(all_sheet_data) if len(row) >= ROW_WIDTH}
+    existing_rcept_nos = set(rcept_row_map)
 
-    for config in bond_configs:
+    # 💡 [수정] 상세/원문 재조회는 시트에 없는 신규 공시 + 최근 RECHECK_DAYS일 공시(정정 반영용)로 한정
+    #    (12일치 목록 전체를 5분마다 재조회하면 DART 일일 호출 한도를 빠르게 소진함)
+    recheck_from = (now - timedelta(days=RECHECK_DAYS)).strftime('%Y%m%d')
+    is_target = ~all_filings['rcept_no'].isin(existing_rcept_nos) | (all_filings['rcept_dt'] >= recheck_from)
+
+    # 💡 [변경] CB/BW/EB 신규 행을 모두 모았다가 마지막에 한 번만 추가 (시트 쓰기 호출 최대 3회 → 1회)
+    data_to_add = []
+    # 💡 [추가] 덮어쓸 기존 행도 모았다가 마지막에 batch_update 한 번으로 처리 (행마다 호출 + 1초 휴식 제거)
+    rows_to_update = []
+
+    for config in BOND_CONFIGS:
         print(f"\n[{config['type']}] 데이터 확인 중...")
-        df_filtered = all_filings[all_filings['report_nm'].str.contains(config['keyword'], na=False)]
+        df_filtered = all_filings[(bond_keywords == config['keyword']) & is_target]
         
         if df_filtered.empty:
-            print(f"ℹ️ {config['type']} 공시가 없습니다.")
+            print(f"ℹ️ 신규 또는 재검사 대상 {config['type']} 공시가 없습니다.")
             continue
             
         corp_codes = df_filtered['corp_code'].unique()
-        detail_dfs = []
-        
-        for code in corp_codes:
+        detail_url = f"https://opendart.fss.or.kr/api/{config['endpoint']}.json"
+
+        def fetch_detail(code):
             detail_params = {'crtfc_key': dart_key, 'corp_code': code, 'bgn_de': start_date, 'end_de': end_date}
-            df_detail = fetch_dart_json(f"https://opendart.fss.or.kr/api/{config['endpoint']}.json", detail_params)
-            if not df_detail.empty:
-                detail_dfs.append(df_detail)
+            return fetch_dart_data(detail_url, detail_params).get('list', [])
+
+        # 💡 [변경] 회사별 상세 API 호출을 순서대로 기다리지 않고 동시에 요청 (결과 순서는 corp_codes 순서 유지)
+        # 회사별로 DataFrame을 만들어 concat하지 않고, 원본 항목을 모아서 DataFrame을 한 번만 생성
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            detail_rows = [item for items in executor.map(fetch_detail, corp_codes) for item in items]
                 
-        if not detail_dfs:
+        if not detail_rows:
             continue
             
-        df_combined = pd.concat(detail_dfs, ignore_index=True)
+        df_combined = pd.DataFrame(detail_rows)
         
         target_rcept_nos = df_filtered['rcept_no'].unique()
         df_merged = df_combined[df_combined['rcept_no'].isin(target_rcept_nos)]
+
+        # 💡 [변경] 접수번호 문자열 변환과 기존 여부 판정을 한 번만 해두고 신규/재검사 분리에 같이 씀
+        merged_rcept_str = df_merged['rcept_no'].astype(str)
+        is_existing = merged_rcept_str.isin(existing_rcept_nos)
+
+        # 💡 [변경] 신규/재검사 대상 전체의 원문 XML 다운로드+파싱을 동시에 처리해두고, 아래 루프에서는 결과만 꺼내 씀
+        merged_rcept_nos = merged_rcept_str.unique()
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            xml_results = dict(zip(merged_rcept_nos, executor.map(lambda r: extract_bond_xml_details(dart_key, r), merged_rcept_nos)))
         
         # ========================================================
         # 🟢 1. 신규 데이터 추가 로직 (기존 유지)
         # ========================================================
-        new_data_df = df_merged[~df_merged['rcept_no'].astype(str).isin(existing_rcept_nos)]
+        new_data_df = df_merged[~is_existing]
         
-        data_to_add = []
         for _, row in new_data_df.iterrows():
             rcept_no = str(row.get('rcept_no', ''))
             print(f" -> [신규] {row.get('corp_name', '')} 데이터 포매팅 중...")
-            xml_data = extract_bond_xml_details(dart_key, rcept_no)
+            xml_data = xml_results[rcept_no]
             
             # 함수로 분리한 포매팅 로직 호출
-            new_row = make_row_data(row, xml_data, config, cls_map)
+            new_row = make_row_data(row, xml_data, config)
             data_to_add.append(new_row)
             
-        if data_to_add:
-            worksheet.append_rows(data_to_add)
-            print(f"✅ {config['type']}: 신규 데이터 {len(data_to_add)}건 추가 완료!")
+        if not new_data_df.empty:
+            print(f"🆕 {config['type']}: 신규 데이터 {len(new_data_df)}건 추가 대기 중...")
 
         # ========================================================
         # 🔄 2. [신규 추가] 기존 데이터 재검사 및 덮어쓰기 로직 (Recheck + Diff + Update)
         # ========================================================
-        existing_data_df = df_merged[df_merged['rcept_no'].astype(str).isin(existing_rcept_nos)]
+        existing_data_df = df_merged[is_existing]
         update_count = 0
         
         for _, row in existing_data_df.iterrows():
@@ -260,24 +280,31 @@ def get_and_update_bonds():
             sheet_row = all_sheet_data[row_idx - 1]
             
             # 2. DART에서 가져온 최신 값으로 다시 25칸 구성
-            xml_data = extract_bond_xml_details(dart_key, rcept_no)
-            new_row = make_row_data(row, xml_data, config, cls_map)
+            xml_data = xml_results[rcept_no]
+            new_row = make_row_data(row, xml_data, config)
             
-            # 3. [Diff 검사] 빈 칸이 있을 수 있으니 길이 25로 맞추고 문자열로 변환하여 완전 동일한지 비교
-            sheet_row_padded = sheet_row + [''] * (25 - len(sheet_row))
+            # 3. [Diff 검사] 빈 칸이 있을 수 있으니 길이 ROW_WIDTH(25)로 맞추고 문자열로 변환하여 완전 동일한지 비교
+            sheet_row_padded = sheet_row + [''] * (ROW_WIDTH - len(sheet_row))
             new_row_str = [str(x) for x in new_row]
 
             # 두 데이터가 1개라도 다르면 (정정공시, 옵션 확정 등) 덮어쓰기!
             if sheet_row_padded != new_row_str:
                 corp_name = row.get('corp_name', '')
-                print(f" 🔄 [업데이트] {corp_name} 값이 변경/확정되었습니다. 시트를 덮어씁니다.")
-                # 변경된 최신 값으로 해당 줄(예: A15) 전체 덮어쓰기
-                worksheet.update(values=[new_row], range_name=f'A{row_idx}')
+                print(f" 🔄 [업데이트] {corp_name} 값이 변경/확정되었습니다. 덮어쓰기 대기 중...")
+                # 변경된 최신 값으로 해당 줄(예: A15) 전체 덮어쓰기 예약
+                rows_to_update.append({'range': f'A{row_idx}', 'values': [new_row]})
                 update_count += 1
-                time.sleep(1) # 구글 API 쓰기 할당량 초과 방지용 휴식
 
         if update_count > 0:
-            print(f"✅ {config['type']}: 기존 데이터 {update_count}건 자동 업데이트 완료!")
+            print(f"🔄 {config['type']}: 기존 데이터 {update_count}건 업데이트 대기 중...")
+
+    if rows_to_update:
+        worksheet.batch_update(rows_to_update)
+        print(f"\n✅ 주식연계채권: 기존 데이터 {len(rows_to_update)}건 일괄 업데이트 완료!")
+
+    if data_to_add:
+        worksheet.append_rows(data_to_add)
+        print(f"\n✅ 주식연계채권: 신규 데이터 {len(data_to_add)}건 일괄 추가 완료!")
 
 if __name__ == "__main__":
     get_and_update_bonds()
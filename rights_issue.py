@@ -2,12 +2,11 @@ import os
 import json
 import gspread
 import pandas as pd
-import requests
-import zipfile
-import io
 import re
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+# DART 호출·원문 다운로드/파싱 공용 함수 (두 봇이 같이 씀)
+from dart_client import MAX_WORKERS, fetch_dart_data, fetch_dart_list, fetch_document_xml, extract_text
 
 # 1. GitHub Secrets 설정값
 dart_key = os.environ['DART_API_KEY']
@@ -19,74 +18,82 @@ creds = json.loads(service_account_str)
 gc = gspread.service_account_from_dict(creds)
 sh = gc.open_by_key(sheet_id)
 
-# --- [JSON 파싱] ---
-def fetch_dart_json(url, params):
-    try:
-        res = requests.get(url, params=params)
-        if res.status_code == 200:
-            data = res.json()
-            if data.get('status') == '000' and 'list' in data:
-                return pd.DataFrame(data['list'])
-    except Exception as e:
-        print(f"JSON API 에러: {e}")
-    return pd.DataFrame()
+# 자금용도 항목 (DART 필드명, 시트에 표시할 이름) - 공시마다 6개 필드를 같은 순서로 훑음
+PURPOSE_FIELDS = (
+    ('fdpp_fclt', '시설'), ('fdpp_bsninh', '영업양수'), ('fdpp_op', '운영'),
+    ('fdpp_dtrp', '채무상환'), ('fdpp_ocsa', '타법인증권'), ('fdpp_etc', '기타'),
+)
+
+# 상장시장 코드(corp_cls) → 시트에 표시할 이름
+MARKET_MAP = {'Y': '유가', 'K': '코스닥', 'N': '코넥스', 'E': '기타'}
+
+# 봇이 쓰는 시트 범위와 한 줄의 칸 수 (A~T열 20칸, 마지막 칸이 접수번호)
+SHEET_RANGE = 'A1:T'
+ROW_WIDTH = 20
+
+# 상세/원문을 다시 받아 정정 여부를 확인할 기간(일) - 이보다 오래되고 이미 시트에 있는 공시는 재조회하지 않음
+# (두 봇이 5분마다 같은 DART 키의 일일 호출 한도를 나눠 쓰므로, 목록 전체를 매번 재검사하면 한도 초과(020) 위험)
+RECHECK_DAYS = 2
+
+# --- [정규식 미리 컴파일] ---
+# 공시마다 같은 패턴을 다시 해석하지 않도록 모듈 로딩 시 한 번만 컴파일
+DIGITS_RE = re.compile(r'\d+')
+ISSUE_PRICE_RE = re.compile(r'발행가액[^\d]*([0-9]{1,3}(?:,[0-9]{3})*)')
+BASE_PRICE_RE = re.compile(r'기준주가[^\d]*([0-9]{1,3}(?:,[0-9]{3})*)')
+DISCOUNT_RE = re.compile(r'할\s*[인증]\s*율[^\d\+\-]*([\-\+]?[0-9\.]+)')
+BOARD_DATE_RE = re.compile(r'이사회결의일[^\d]*(\d{4}[\-\.년\s]+\d{1,2}[\-\.월\s]+\d{1,2})')
+PAY_DATE_RE = re.compile(r'납\s*입\s*일[^\d]*(\d{4}[\-\.년\s]+\d{1,2}[\-\.월\s]+\d{1,2})')
+DIV_DATE_RE = re.compile(r'배당기산일[^\d]*(\d{4}[\-\.년\s]+\d{1,2}[\-\.월\s]+\d{1,2})')
+LIST_DATE_RE = re.compile(r'상장\s*예정일[^\d]*(\d{4}[\-\.년\s]+\d{1,2}[\-\.월\s]+\d{1,2})')
+
+# 💡 [추가] 날짜를 YYYY년 MM월 DD일 로 깔끔하게 강제 포맷팅하는 헬퍼 함수
+def fix_date(raw_date_str):
+    if not raw_date_str: return '-'
+    # 숫자만 3개(연, 월, 일) 뽑아냄
+    nums = DIGITS_RE.findall(raw_date_str)
+    if len(nums) >= 3:
+        return f"{nums[0]}년 {nums[1].zfill(2)}월 {nums[2].zfill(2)}일"
+    return raw_date_str + "일" # 숫자가 부족하면 임시방편으로 '일'만 붙임
 
 # --- [XML 원문 족집게 파싱 (정규식 초정밀 업그레이드)] ---
 def extract_xml_details(api_key, rcept_no):
-    url = "https://opendart.fss.or.kr/api/document.xml"
-    params = {'crtfc_key': api_key, 'rcept_no': rcept_no}
-    
     extracted = {
         'board_date': '-', 'issue_price': '-', 'base_price': '-', 'discount': '-',
         'pay_date': '-', 'div_date': '-', 'list_date': '-', 'investor': '원문참조'
     }
     
     try:
-        res = requests.get(url, params=params, stream=True)
-        if res.status_code == 200:
-            with zipfile.ZipFile(io.BytesIO(res.content)) as z:
-                xml_filename = [name for name in z.namelist() if name.endswith('.xml')][0]
-                with z.open(xml_filename) as f:
-                    xml_content = f.read().decode('utf-8')
-                    soup = BeautifulSoup(xml_content, 'html.parser')
-                    raw_text = soup.get_text(separator=' ', strip=True)
-                    
-                    # 💡 [추가] 날짜를 YYYY년 MM월 DD일 로 깔끔하게 강제 포맷팅하는 헬퍼 함수
-                    def fix_date(raw_date_str):
-                        if not raw_date_str: return '-'
-                        # 숫자만 3개(연, 월, 일) 뽑아냄
-                        nums = re.findall(r'\d+', raw_date_str)
-                        if len(nums) >= 3:
-                            return f"{nums[0]}년 {nums[1].zfill(2)}월 {nums[2].zfill(2)}일"
-                        return raw_date_str + "일" # 숫자가 부족하면 임시방편으로 '일'만 붙임
-                    
-                    # 1. 확정발행가 추출 (글자 사이 잡문자 무시하고 첫 숫자 매칭)
-                    issue = re.search(r'발행가액[^\d]*([0-9]{1,3}(?:,[0-9]{3})*)', raw_text)
-                    if issue: extracted['issue_price'] = issue.group(1).strip()
-                    
-                    # 2. 기준주가 추출
-                    base = re.search(r'기준주가[^\d]*([0-9]{1,3}(?:,[0-9]{3})*)', raw_text)
-                    if base: extracted['base_price'] = base.group(1).strip()
-                    
-                    # 3. 할인/할증률 추출 (마이너스 기호가 살도록 정규식 핀셋 수정 완료!)
-                    disc = re.search(r'할\s*[인증]\s*율[^\d\+\-]*([\-\+]?[0-9\.]+)', raw_text)
-                    if disc: extracted['discount'] = disc.group(1).strip() + "%"
-                    
-                    # 4. 날짜 추출 (이사회, 납입일, 배당기산일, 상장예정일) + 💡 fix_date 적용!
-                    board = re.search(r'이사회결의일[^\d]*(\d{4}[\-\.년\s]+\d{1,2}[\-\.월\s]+\d{1,2})', raw_text)
-                    if board: extracted['board_date'] = fix_date(board.group(1).strip())
-                    
-                    pay = re.search(r'납\s*입\s*일[^\d]*(\d{4}[\-\.년\s]+\d{1,2}[\-\.월\s]+\d{1,2})', raw_text)
-                    if pay: extracted['pay_date'] = fix_date(pay.group(1).strip())
-                    
-                    div = re.search(r'배당기산일[^\d]*(\d{4}[\-\.년\s]+\d{1,2}[\-\.월\s]+\d{1,2})', raw_text)
-                    if div: extracted['div_date'] = fix_date(div.group(1).strip())
-                    
-                    list_d = re.search(r'상장\s*예정일[^\d]*(\d{4}[\-\.년\s]+\d{1,2}[\-\.월\s]+\d{1,2})', raw_text)
-                    if list_d: extracted['list_date'] = fix_date(list_d.group(1).strip())
-                    
-                    # 5. 투자자
-                    if "제3자배정" in raw_text: extracted['investor'] = "제3자배정 (원문참조)"
+        xml_bytes = fetch_document_xml(api_key, rcept_no)
+        if xml_bytes:
+            raw_text = extract_text(xml_bytes)
+            
+            # 1. 확정발행가 추출 (글자 사이 잡문자 무시하고 첫 숫자 매칭)
+            issue = ISSUE_PRICE_RE.search(raw_text)
+            if issue: extracted['issue_price'] = issue.group(1).strip()
+            
+            # 2. 기준주가 추출
+            base = BASE_PRICE_RE.search(raw_text)
+            if base: extracted['base_price'] = base.group(1).strip()
+            
+            # 3. 할인/할증률 추출 (마이너스 기호가 살도록 정규식 핀셋 수정 완료!)
+            disc = DISCOUNT_RE.search(raw_text)
+            if disc: extracted['discount'] = disc.group(1).strip() + "%"
+            
+            # 4. 날짜 추출 (이사회, 납입일, 배당기산일, 상장예정일) + 💡 fix_date 적용!
+            board = BOARD_DATE_RE.search(raw_text)
+            if board: extracted['board_date'] = fix_date(board.group(1).strip())
+            
+            pay = PAY_DATE_RE.search(raw_text)
+            if pay: extracted['pay_date'] = fix_date(pay.group(1).strip())
+            
+            div = DIV_DATE_RE.search(raw_text)
+            if div: extracted['div_date'] = fix_date(div.group(1).strip())
+            
+            list_d = LIST_DATE_RE.search(raw_text)
+            if list_d: extracted['list_date'] = fix_date(list_d.group(1).strip())
+            
+            # 5. 투자자
+            if "제3자배정" in raw_text: extracted['investor'] = "제3자배정 (원문참조)"
 
     except Exception as e:
         print(f"문서 XML 에러 ({rcept_no}): {e}")
@@ -96,14 +103,20 @@ def extract_xml_details(api_key, rcept_no):
 # 안전한 숫자 변환 함수
 def to_int(val):
     try:
-        if pd.isna(val) or str(val).strip() == '': return 0
-        return int(float(str(val).replace(',', '').strip()))
+        if pd.isna(val): return 0
+        s = str(val).replace(',', '').strip()
+        if s == '': return 0
+        # 대부분 정수 문자열이라 float를 거치지 않고 바로 변환
+        if s.isdigit(): return int(s)
+        return int(float(s))
     except:
         return 0
 
 def get_and_update_yusang():
-    end_date = datetime.now().strftime('%Y%m%d')
-    start_date = (datetime.now() - timedelta(days=7)).strftime('%Y%m%d')
+    # 실행 시각은 한 번만 읽어서 시작/종료일을 같은 기준으로 계산 (자정 직전 실행 시 날짜가 어긋나지 않음)
+    now = datetime.now()
+    end_date = now.strftime('%Y%m%d')
+    start_date = (now - timedelta(days=7)).strftime('%Y%m%d')
 
     print("최근 7일 유상증자 공시 탐색 중 (데이터 최신화 검증 로직 포함)...")
     
@@ -112,7 +125,7 @@ def get_and_update_yusang():
         'crtfc_key': dart_key, 'bgn_de': start_date, 'end_de': end_date, 
         'pblntf_ty': 'B', 'pblntf_detail_ty': 'B001', 'page_count': '100'
     }
-    all_filings = fetch_dart_json(list_url, list_params)
+    all_filings = fetch_dart_list(list_url, list_params)
 
     if all_filings.empty:
         print("최근 7일간 주요사항보고서가 없습니다.")
@@ -123,51 +136,69 @@ def get_and_update_yusang():
         print("ℹ️ 유상증자 공시가 없습니다.")
         return
         
-    corp_codes = df_filtered['corp_code'].unique()
-    detail_dfs = []
-    
-    for code in corp_codes:
-        detail_params = {'crtfc_key': dart_key, 'corp_code': code, 'bgn_de': start_date, 'end_de': end_date}
-        df_detail = fetch_dart_json('https://opendart.fss.or.kr/api/piicDecsn.json', detail_params)
-        if not df_detail.empty:
-            detail_dfs.append(df_detail)
-            
-    if not detail_dfs:
-        print("ℹ️ 상세 데이터를 불러올 수 없습니다.")
-        return
-        
-    df_combined = pd.concat(detail_dfs, ignore_index=True)
-    
-    # 상장시장(corp_cls) 이름 충돌 방지를 위해 목록에서는 rcept_no만 가져와 병합
-    df_merged = pd.merge(df_combined, df_filtered[['rcept_no']], on='rcept_no', how='inner')
-    
     worksheet = sh.worksheet('유상증자')
     
     # 💡 [추가] Recheck + Diff + Update 로직을 위한 기존 시트 데이터 전체 불러오기
-    all_sheet_data = worksheet.get_all_values()
+    # 봇이 쓰는 A~T열(20칸)만 범위를 지정해서 읽어옴 (Diff는 보이는 문자열 기준이라 기본 렌더링 유지)
+    all_sheet_data = worksheet.get_values(SHEET_RANGE)
     existing_data_dict = {}
     
     # 구글 시트에 있는 데이터를 { '접수번호': { '행번호': 2, '데이터': ['값1', '값2'...] } } 형태로 메모리에 저장
     for idx, row_data in enumerate(all_sheet_data):
-        if len(row_data) >= 20: # 20번째 칸(T열)이 접수번호
-            rcept_val = str(row_data[19]).strip()
+        if len(row_data) >= ROW_WIDTH: # 마지막 칸(T열)이 접수번호
+            rcept_val = str(row_data[ROW_WIDTH - 1]).strip()
             existing_data_dict[rcept_val] = {
                 'row_idx': idx + 1, # 구글 시트는 1행부터 시작하므로 +1
                 'data': [str(x).strip() for x in row_data] # 공백 제거 후 문자열로 저장
             }
+
+    # 💡 [수정] 상세/원문 재조회는 시트에 없는 신규 공시 + 최근 RECHECK_DAYS일 공시(정정 반영용)로 한정
+    #    (7일치 목록 전체를 5분마다 재조회하면 DART 일일 호출 한도를 빠르게 소진함)
+    recheck_from = (now - timedelta(days=RECHECK_DAYS)).strftime('%Y%m%d')
+    is_new = ~df_filtered['rcept_no'].isin(existing_data_dict.keys())
+    df_filtered = df_filtered[is_new | (df_filtered['rcept_dt'] >= recheck_from)]
+    if df_filtered.empty:
+        print("ℹ️ 신규 또는 재검사 대상 유상증자 공시가 없습니다.")
+        return
+
+    corp_codes = df_filtered['corp_code'].unique()
+
+    def fetch_detail(code):
+        detail_params = {'crtfc_key': dart_key, 'corp_code': code, 'bgn_de': start_date, 'end_de': end_date}
+        return fetch_dart_data('https://opendart.fss.or.kr/api/piicDecsn.json', detail_params).get('list', [])
+
+    # 💡 [변경] 회사별 상세 API 호출을 순서대로 기다리지 않고 동시에 요청 (결과 순서는 corp_codes 순서 유지)
+    # 회사별로 DataFrame을 만들어 concat하지 않고, 원본 항목을 모아서 DataFrame을 한 번만 생성
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        detail_rows = [item for items in executor.map(fetch_detail, corp_codes) for item in items]
             
+    if not detail_rows:
+        print("ℹ️ 상세 데이터를 불러올 수 없습니다.")
+        return
+        
+    df_combined = pd.DataFrame(detail_rows)
+    
+    # 상장시장(corp_cls) 이름 충돌 방지를 위해 목록에서는 rcept_no만 가져와 병합
+    df_merged = pd.merge(df_combined, df_filtered[['rcept_no']], on='rcept_no', how='inner')
+
+    # 💡 [변경] 공시별 원문 XML 다운로드+파싱을 동시에 처리해두고, 아래 루프에서는 결과만 꺼내 씀
+    merged_rcept_nos = df_merged['rcept_no'].astype(str).unique()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        xml_results = dict(zip(merged_rcept_nos, executor.map(lambda r: extract_xml_details(dart_key, r), merged_rcept_nos)))
+    
     data_to_add = []
-    cls_map = {'Y': '유가', 'K': '코스닥', 'N': '코넥스', 'E': '기타'}
+    # 💡 [추가] 변경된 기존 행은 모았다가 마지막에 batch_update 한 번으로 덮어쓰기 (행마다 API 호출 제거)
+    rows_to_update = []
     
-    # 💡 [수정] 필터링 없이 일단 최근 7일치 공시 전체를 훑으며 변경사항(Diff)이 있는지 검사합니다.
+    # 💡 [수정] 신규 공시와 최근 RECHECK_DAYS일 공시를 훑으며 변경사항(Diff)이 있는지 검사합니다.
     for _, row in df_merged.iterrows():
         rcept_no = str(row.get('rcept_no', ''))
         corp_name = row.get('corp_name', '')
         
-        xml_data = extract_xml_details(dart_key, rcept_no)
+        xml_data = xml_results[rcept_no]
         
         # 1. 상장시장 (에러 해결)
-        market = cls_map.get(row.get('corp_cls', ''), '기타')
+        market = MARKET_MAP.get(row.get('corp_cls', ''), '기타')
         method = row.get('ic_mthn', '')
         
         # 2. 주식수 & 천 단위 콤마
@@ -187,24 +218,13 @@ def get_and_update_yusang():
         ratio = f"{(new_shares / old_shares * 100):.2f}%" if old_shares > 0 else "-"
         
         # 4. 확정발행금액 (억원 단위, 소수점 2자리 세밀하게)
-        fclt = to_int(row.get('fdpp_fclt'))
-        bsninh = to_int(row.get('fdpp_bsninh'))
-        op = to_int(row.get('fdpp_op'))
-        dtrp = to_int(row.get('fdpp_dtrp'))
-        ocsa = to_int(row.get('fdpp_ocsa'))
-        etc = to_int(row.get('fdpp_etc'))
+        amounts = [to_int(row.get(key)) for key, _ in PURPOSE_FIELDS]
         
-        total_amt = fclt + bsninh + op + dtrp + ocsa + etc
+        total_amt = sum(amounts)
         total_amt_uk = f"{(total_amt / 100000000):,.2f}" if total_amt > 0 else "0.00"
         
         # 자금용도 추출
-        purposes = []
-        if fclt > 0: purposes.append("시설")
-        if bsninh > 0: purposes.append("영업양수")
-        if op > 0: purposes.append("운영")
-        if dtrp > 0: purposes.append("채무상환")
-        if ocsa > 0: purposes.append("타법인증권")
-        if etc > 0: purposes.append("기타")
+        purposes = [label for (_, label), amt in zip(PURPOSE_FIELDS, amounts) if amt > 0]
         purpose_str = ", ".join(purposes)
         
         link = f"https://dart.fss.or.kr/dsaf001/main.do?rcpNo={rcept_no}"
@@ -247,11 +267,8 @@ def get_and_update_yusang():
             # Diff 검사: 하나라도 값이 다르다면 업데이트 실행!
             if new_row_str != existing_row_str:
                 row_idx = existing_data_dict[rcept_no]['row_idx']
-                try:
-                    worksheet.update(range_name=f'A{row_idx}:T{row_idx}', values=[new_row])
-                except TypeError:
-                    worksheet.update(f'A{row_idx}:T{row_idx}', [new_row])
-                print(f" 🔄 {corp_name}: 데이터 변경 감지! 최신 내용으로 자동 덮어쓰기 완료 (행: {row_idx})")
+                rows_to_update.append({'range': f'A{row_idx}', 'values': [new_row]})
+                print(f" 🔄 {corp_name}: 데이터 변경 감지! 덮어쓰기 대기 중... (행: {row_idx})")
             else:
                 print(f" ⏩ {corp_name}: 변경사항 없음 (패스)")
                 
@@ -260,6 +277,11 @@ def get_and_update_yusang():
             print(f" 🆕 {corp_name}: 신규 공시 발견! 추가 대기 중...")
             data_to_add.append(new_row)
         
+    # 변경된 기존 행은 한 번의 요청으로 일괄 덮어쓰기
+    if rows_to_update:
+        worksheet.batch_update(rows_to_update)
+        print(f"✅ 유상증자: 기존 데이터 {len(rows_to_update)}건 일괄 업데이트 완료!")
+
     # 신규 데이터가 있으면 맨 밑에 일괄 추가
     if data_to_add:
         worksheet.append_rows(data_to_add)